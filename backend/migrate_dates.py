@@ -0,0 +1,30 @@
+"""One-shot migration: convert ISO date strings in indexed documents to BSON dates
+
+Run once after upgrading: python migrate_dates.py
+"""
+from dotenv import load_dotenv
+from pymongo import MongoClient
+from pathlib import Path
+import os
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+DATE_FIELDS = ['created_at', 'updated_at', 'indexed_at']
+
+def migrate():
+    client = MongoClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+
+    try:
+        for field in DATE_FIELDS:
+            result = db.documents.update_many(
+                {field: {"$type": "string"}},
+                [{"$set": {field: {"$dateFromString": {"dateString": f"${field}"}}}}]
+            )
+            print(f"{field}: converted {result.modified_count} documents")
+    finally:
+        client.close()
+
+if __name__ == "__main__":
+    migrate()
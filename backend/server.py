@@ -1,28 +1,33 @@
-from fastapi import FastAPI, APIRouter, BackgroundTasks, HTTPException
-from fastapi.responses import FileResponse
+from fastapi import FastAPI, APIRouter, BackgroundTasks, HTTPException, Request
+from fastapi.responses import FileResponse, ORJSONResponse, Response
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReplaceOne, UpdateOne
+from pymongo.errors import BulkWriteError
 import os
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field
-from typing import List, Optional, Dict, Any
+from typing import Iterable, List, Optional, Dict, Any
 import uuid
 from datetime import datetime, timezone
 import asyncio
+import contextlib
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 import json
 import hashlib
-import mimetypes
-import base64
+import re
+import stat
 
 # Document parsing imports
-import PyPDF2
+from pypdf import PdfReader
 from docx import Document
 import openpyxl
-import magic
+import xlrd
 from watchdog.observers import Observer
-from watchdog.events import FileSystemEventHandler
+from watchdog.events import FileSystemEventHandler, EVENT_TYPE_CREATED, EVENT_TYPE_DELETED, EVENT_TYPE_MOVED
 from PIL import Image
 import io
 
@@ -31,11 +36,12 @@ load_dotenv(ROOT_DIR / '.env')
 
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+# tz_aware so stored BSON dates come back as UTC datetimes, not naive ones
+client = AsyncIOMotorClient(mongo_url, tz_aware=True, tzinfo=timezone.utc)
 db = client[os.environ['DB_NAME']]
 
 # Create the main app without a prefix
-app = FastAPI()
+app = FastAPI(default_response_class=ORJSONResponse)
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
@@ -43,7 +49,38 @@ api_router = APIRouter(prefix="/api")
 # Global variables for file monitoring
 DOCUMENT_ROOT = Path("/var/www/html/MPK/doc/")
 file_observer = None
+index_queue: Optional[asyncio.Queue] = None
+file_event_task: Optional[asyncio.Task] = None
+initial_scan_task: Optional[asyncio.Task] = None
+# Only used when the document root can't be watched
+periodic_scan_task: Optional[asyncio.Task] = None
+# Per-path timers holding back file events until a burst has settled
+pending_file_events: Dict[str, asyncio.TimerHandle] = {}
+parse_executor: Optional[ProcessPoolExecutor] = None
+# Files that recently yielded no text, keyed by (path, mtime_ns, size)
+parse_cache: OrderedDict = OrderedDict()
+# Serialized /file-tree response, invalidated on file system events
+file_tree_cache: Optional[bytes] = None
+# Bumped on every invalidation so a build that raced one is not cached
+file_tree_generation = 0
+file_tree_lock = asyncio.Lock()
 last_scan_time = datetime.now(timezone.utc)
+HASH_CHUNK_SIZE = 1024 * 1024  # 1 MiB
+FILE_EVENT_DEBOUNCE = 0.5  # seconds
+PERIODIC_SCAN_INTERVAL = 300  # seconds, fallback when file monitoring is unavailable
+# Extracted text beyond this many UTF-8 bytes is not stored or searched
+MAX_INDEXED_CONTENT_BYTES = int(os.environ.get('MAX_INDEXED_CONTENT_BYTES', 1024 * 1024))
+PREVIEW_LENGTH = 200
+SUPPORTED_EXTENSIONS = frozenset({'.pdf', '.docx', '.doc', '.xlsx', '.xls', '.txt', '.rtf'})
+# Cheap to read; parsed on a thread rather than shipped to the process pool
+PLAIN_TEXT_EXTENSIONS = frozenset({'.txt', '.rtf'})
+SCAN_BATCH_SIZE = 64
+PARSE_CACHE_SIZE = 1024
+BULK_WRITE_SIZE = 500
+PHRASE_MIN_WORDS = 2
+PHRASE_MAX_WORDS = 6
+MAX_PHRASES_PER_DOCUMENT = 10000
+PHRASE_MATCH_BOOST = 1.0  # added to the relevance score per matched phrase
 
 # Document Models
 class DocumentFile(BaseModel):
@@ -53,8 +90,10 @@ class DocumentFile(BaseModel):
     relative_path: str
     file_type: str
     size: int
+    mtime_ns: Optional[int] = None
+    content_hash: Optional[str] = None
     content: Optional[str] = None
-    thumbnail: Optional[str] = None
+    content_truncated: bool = False
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     indexed_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
@@ -66,150 +105,342 @@ class FileTreeNode(BaseModel):
     children: Optional[List['FileTreeNode']] = []
     file_info: Optional[DocumentFile] = None
 
-class SearchResult(BaseModel):
-    document: DocumentFile
-    relevance_score: float
-    snippet: str
-
 class SearchRequest(BaseModel):
     query: str
     limit: int = 20
 
 # Document content extraction functions
-def extract_pdf_content(file_path: Path) -> tuple[str, str]:
-    """Extract text content and generate thumbnail from PDF"""
+def collect_until_cap(pieces: Iterable[str]) -> List[str]:
+    """Consume text pieces until their UTF-8 size passes MAX_INDEXED_CONTENT_BYTES"""
+    # Text past the cap is discarded anyway, so lazily produced pieces
+    # (pages, paragraphs, rows) after it are never extracted
+    parts = []
+    collected = 0
+    for piece in pieces:
+        parts.append(piece)
+        collected += len(piece.encode('utf-8')) + 1
+        if collected > MAX_INDEXED_CONTENT_BYTES:
+            break
+    return parts
+
+def extract_pdf_content(file_path: Path) -> str:
+    """Extract text content from PDF"""
     try:
         with open(file_path, 'rb') as file:
-            pdf_reader = PyPDF2.PdfReader(file)
-            text = ""
-            for page in pdf_reader.pages:
-                text += page.extract_text() + "\n"
-            
-            # Generate simple thumbnail (text preview)
-            preview_text = text[:200] + "..." if len(text) > 200 else text
-            thumbnail = f"data:text/plain;base64,{base64.b64encode(preview_text.encode()).decode()}"
-            
-            return text.strip(), thumbnail
+            pdf_reader = PdfReader(file)
+            parts = collect_until_cap(page.extract_text() or "" for page in pdf_reader.pages)
+            return "\n".join(parts).strip()
     except Exception as e:
         logging.error(f"Error extracting PDF content from {file_path}: {e}")
-        return "", ""
+        return ""
 
-def extract_docx_content(file_path: Path) -> tuple[str, str]:
+def extract_docx_content(file_path: Path) -> str:
     """Extract text content from DOCX"""
     try:
         doc = Document(file_path)
-        text = ""
-        for paragraph in doc.paragraphs:
-            text += paragraph.text + "\n"
-        
-        preview_text = text[:200] + "..." if len(text) > 200 else text
-        thumbnail = f"data:text/plain;base64,{base64.b64encode(preview_text.encode()).decode()}"
-        
-        return text.strip(), thumbnail
+        parts = collect_until_cap(paragraph.text for paragraph in doc.paragraphs)
+        return "\n".join(parts).strip()
     except Exception as e:
         logging.error(f"Error extracting DOCX content from {file_path}: {e}")
-        return "", ""
+        return ""
 
-def extract_xlsx_content(file_path: Path) -> tuple[str, str]:
+def extract_xlsx_content(file_path: Path) -> str:
     """Extract text content from Excel files"""
     try:
-        workbook = openpyxl.load_workbook(file_path)
-        text = ""
+        # Read-only mode streams rows instead of loading the styled cell model
+        workbook = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
         
-        for sheet_name in workbook.sheetnames:
-            sheet = workbook[sheet_name]
-            text += f"Sheet: {sheet_name}\n"
-            
-            for row in sheet.iter_rows(values_only=True):
-                row_text = "\t".join([str(cell) if cell is not None else "" for cell in row])
-                if row_text.strip():
-                    text += row_text + "\n"
+        def sheet_lines():
+            for sheet_name in workbook.sheetnames:
+                sheet = workbook[sheet_name]
+                yield f"Sheet: {sheet_name}"
+                
+                for row in sheet.iter_rows(values_only=True):
+                    row_text = "\t".join([str(cell) if cell is not None else "" for cell in row])
+                    if row_text.strip():
+                        yield row_text
         
-        preview_text = text[:200] + "..." if len(text) > 200 else text
-        thumbnail = f"data:text/plain;base64,{base64.b64encode(preview_text.encode()).decode()}"
+        with contextlib.closing(workbook):
+            parts = collect_until_cap(sheet_lines())
         
-        return text.strip(), thumbnail
+        return "\n".join(parts).strip()
     except Exception as e:
         logging.error(f"Error extracting Excel content from {file_path}: {e}")
-        return "", ""
+        return ""
 
-def extract_text_content(file_path: Path) -> tuple[str, str]:
-    """Extract content from plain text files"""
+def extract_xls_content(file_path: Path) -> str:
+    """Extract text content from legacy Excel (.xls) files"""
     try:
-        with open(file_path, 'r', encoding='utf-8') as file:
-            text = file.read()
+        workbook = xlrd.open_workbook(str(file_path), on_demand=True)
         
-        preview_text = text[:200] + "..." if len(text) > 200 else text
-        thumbnail = f"data:text/plain;base64,{base64.b64encode(preview_text.encode()).decode()}"
+        def sheet_lines():
+            for sheet_index in range(workbook.nsheets):
+                sheet = workbook.sheet_by_index(sheet_index)
+                yield f"Sheet: {sheet.name}"
+                
+                for row_index in range(sheet.nrows):
+                    row_text = "\t".join([str(cell) if cell not in (None, "") else "" for cell in sheet.row_values(row_index)])
+                    if row_text.strip():
+                        yield row_text
+                
+                workbook.unload_sheet(sheet_index)
         
-        return text, thumbnail
+        try:
+            parts = collect_until_cap(sheet_lines())
+        finally:
+            workbook.release_resources()
+        
+        return "\n".join(parts).strip()
     except Exception as e:
-        logging.error(f"Error extracting text content from {file_path}: {e}")
-        return "", ""
+        logging.error(f"Error extracting Excel content from {file_path}: {e}")
+        return ""
 
-def extract_document_content(file_path: Path) -> tuple[str, str]:
-    """Extract content based on file type"""
+def extract_text_content(file_path: Path) -> str:
+    """Extract content from plain text files"""
     try:
-        mime_type, _ = mimetypes.guess_type(str(file_path))
-        file_extension = file_path.suffix.lower()
-        
-        if file_extension == '.pdf' or mime_type == 'application/pdf':
-            return extract_pdf_content(file_path)
-        elif file_extension in ['.docx', '.doc'] or mime_type in ['application/vnd.openxmlformats-officedocument.wordprocessingml.document']:
-            return extract_docx_content(file_path)
-        elif file_extension in ['.xlsx', '.xls'] or mime_type in ['application/vnd.openxmlformats-officedocument.spreadsheetml.sheet']:
-            return extract_xlsx_content(file_path)
-        elif file_extension in ['.txt', '.rtf'] or mime_type == 'text/plain':
-            return extract_text_content(file_path)
-        else:
-            return "", ""
+        with open(file_path, 'r', encoding='utf-8') as file:
+            # One character past the cap is at least one byte past it, which
+            # is enough for cap_content to mark the text truncated
+            return file.read(MAX_INDEXED_CONTENT_BYTES + 1)
     except Exception as e:
-        logging.error(f"Error determining file type for {file_path}: {e}")
-        return "", ""
+        logging.error(f"Error extracting text content from {file_path}: {e}")
+        return ""
+
+# File extension -> content extractor
+DOCUMENT_EXTRACTORS = {
+    '.pdf': extract_pdf_content,
+    '.docx': extract_docx_content,
+    '.doc': extract_docx_content,
+    '.xlsx': extract_xlsx_content,
+    '.xls': extract_xls_content,
+    '.txt': extract_text_content,
+    '.rtf': extract_text_content,
+}
+
+def extract_document_content(file_path: Path) -> str:
+    """Extract content based on file type"""
+    extractor = DOCUMENT_EXTRACTORS.get(file_path.suffix.lower())
+    return extractor(file_path) if extractor else ""
+
+def cap_content(content: str) -> tuple[str, bool]:
+    """Truncate content to MAX_INDEXED_CONTENT_BYTES, reporting whether it was cut"""
+    encoded_content = content.encode('utf-8')
+    if len(encoded_content) <= MAX_INDEXED_CONTENT_BYTES:
+        return content, False
+    return encoded_content[:MAX_INDEXED_CONTENT_BYTES].decode('utf-8', errors='ignore'), True
+
+def extract_capped_content(file_path: Path) -> tuple[str, bool]:
+    """Extract content and apply the size cap in the worker, before it is cached or stored"""
+    return cap_content(extract_document_content(file_path))
+
+def compute_file_hash(file_path: Path) -> str:
+    """Compute SHA-256 fingerprint of file bytes"""
+    # Streamed rather than mmapped: files may be truncated while being hashed
+    sha = hashlib.sha256()
+    buffer = bytearray(HASH_CHUNK_SIZE)
+    view = memoryview(buffer)
+    with open(file_path, 'rb', buffering=0) as file:
+        while True:
+            read = file.readinto(buffer)
+            if not read:
+                break
+            sha.update(view[:read])
+    return sha.hexdigest()
+
+def download_etag(doc: Dict[str, Any], file_stats: os.stat_result) -> Optional[str]:
+    """Quoted content hash, or None once the file on disk no longer matches the indexed one"""
+    if (doc.get('content_hash') and doc.get('mtime_ns') == file_stats.st_mtime_ns
+            and doc.get('size') == file_stats.st_size):
+        return f'"{doc["content_hash"]}"'
+    return None
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """Check an If-None-Match header against an ETag using weak comparison"""
+    client_etags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return etag in client_etags or "*" in client_etags
+
+def tokenize(text: str) -> List[str]:
+    """Split text into lowercase word tokens"""
+    return re.findall(r"\w+", text.lower())
+
+def build_phraselist(text: str) -> List[str]:
+    """Collect the distinct 2-6 word phrases of a text, in order of first appearance"""
+    tokens = tokenize(text)
+    phrases = {}
+    for start in range(len(tokens)):
+        for length in range(PHRASE_MIN_WORDS, PHRASE_MAX_WORDS + 1):
+            if start + length > len(tokens):
+                break
+            phrases.setdefault(" ".join(tokens[start:start + length]), None)
+        if len(phrases) >= MAX_PHRASES_PER_DOCUMENT:
+            break
+    return list(phrases)[:MAX_PHRASES_PER_DOCUMENT]
+
+def uses_phrase_search(query: str) -> bool:
+    """Whether a query is short enough for phrase matching and free of $text operators"""
+    # Quoted phrases and -negations only mean something to $text
+    if '"' in query or re.search(r"(^|\s)-\S", query):
+        return False
+    return PHRASE_MIN_WORDS <= len(tokenize(query)) <= PHRASE_MAX_WORDS
+
+def merge_search_results(text_results: List[Dict[str, Any]], phrase_results: List[Dict[str, Any]], limit: int) -> List[Dict[str, Any]]:
+    """Union text and phrase hits by path, adding phrase scores as a boost"""
+    merged = {result['document']['path']: result for result in text_results}
+    for result in phrase_results:
+        boost = result['relevance_score'] * PHRASE_MATCH_BOOST
+        existing = merged.get(result['document']['path'])
+        if existing is not None:
+            existing['relevance_score'] += boost
+        else:
+            merged[result['document']['path']] = {**result, 'relevance_score': boost}
+    return sorted(merged.values(), key=lambda result: result['relevance_score'], reverse=True)[:limit]
+
+async def extract_document_content_cached(file_path: Path, file_stats: os.stat_result) -> tuple[str, bool]:
+    """Extract capped content off the event loop, skipping files recently found unparseable"""
+    key = (str(file_path), file_stats.st_mtime_ns, file_stats.st_size)
+    if key in parse_cache:
+        parse_cache.move_to_end(key)
+        return "", False
+    
+    if file_path.suffix.lower() in PLAIN_TEXT_EXTENSIONS:
+        extracted = await asyncio.to_thread(extract_capped_content, file_path)
+    else:
+        loop = asyncio.get_running_loop()
+        extracted = await loop.run_in_executor(parse_executor, extract_capped_content, file_path)
+    
+    # Files that yield text are stored, after which the mtime/size pre-check
+    # skips them before this point; only empty results are worth remembering
+    if not extracted[0]:
+        parse_cache[key] = None
+        if len(parse_cache) > PARSE_CACHE_SIZE:
+            parse_cache.popitem(last=False)
+    return extracted
+
+# Fields needed to decide whether a stored document is still current
+INDEX_STATE_PROJECTION = {"_id": 0, "path": 1, "size": 1, "mtime_ns": 1, "content_hash": 1}
+
+async def build_index_operations(file_path: Path, existing: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Build the database writes, keyed by collection, needed to bring a file's index entry up to date"""
+    try:
+        file_stats = await asyncio.to_thread(file_path.stat)
+    except FileNotFoundError:
+        return {}
+    if stat.S_ISDIR(file_stats.st_mode):
+        return {}
+    
+    # Cheap pre-check: unchanged mtime and size means unchanged file
+    if existing and existing.get('mtime_ns') == file_stats.st_mtime_ns and existing.get('size') == file_stats.st_size:
+        return {}
+    
+    # Same bytes under a new mtime (e.g. touch or copy) - skip parsing
+    content_hash = await asyncio.to_thread(compute_file_hash, file_path)
+    if existing and existing.get('content_hash') == content_hash:
+        return {
+            "documents": UpdateOne(
+                {"path": str(file_path)},
+                {"$set": {"mtime_ns": file_stats.st_mtime_ns, "size": file_stats.st_size}}
+            )
+        }
+    
+    # Extract content off the event loop, capped to keep outliers well below
+    # MongoDB's 16 MB document limit
+    content, content_truncated = await extract_document_content_cached(file_path, file_stats)
+    
+    if not content:  # Skip files we can't parse
+        return {}
+    
+    relative_path = str(file_path.relative_to(DOCUMENT_ROOT))
+    
+    doc_file = DocumentFile(
+        name=file_path.name,
+        path=str(file_path),
+        relative_path=relative_path,
+        file_type=file_path.suffix.lower(),
+        size=file_stats.st_size,
+        mtime_ns=file_stats.st_mtime_ns,
+        content_hash=content_hash,
+        content=content,
+        content_truncated=content_truncated
+    )
+    
+    # Metadata and content live in separate collections so searches and
+    # listings don't drag full document bodies around
+    doc_dict = doc_file.dict(exclude={'content'})
+    
+    loop = asyncio.get_running_loop()
+    phraselist = await loop.run_in_executor(parse_executor, build_phraselist, content)
+    
+    content_dict = {"path": str(file_path), "name": file_path.name, "content": content, "phraselist": phraselist}
+    
+    return {
+        "document_contents": ReplaceOne({"path": str(file_path)}, content_dict, upsert=True),
+        "documents": ReplaceOne({"path": str(file_path)}, doc_dict, upsert=True)
+    }
 
-async def index_file(file_path: Path) -> Optional[DocumentFile]:
+# Content is written before metadata: the stored mtime_ns/size is what marks
+# a file as indexed, so it must only land once the content is stored
+INDEX_WRITE_ORDER = ("document_contents", "documents")
+
+async def write_index_operations(pending: Dict[str, list]) -> int:
+    """Flush queued (path, operation) pairs to their collections"""
+    written = 0
+    failed_paths = set()
+    for collection_name in INDEX_WRITE_ORDER:
+        queued = pending.get(collection_name, [])
+        entries = [(path, operation) for path, operation in queued if path not in failed_paths]
+        queued.clear()
+        if not entries:
+            continue
+        try:
+            await db[collection_name].bulk_write([operation for _, operation in entries], ordered=False)
+            written += len(entries)
+        except BulkWriteError as e:
+            # Unordered writes still apply every operation that didn't fail
+            write_errors = e.details.get('writeErrors', [])
+            for error in write_errors:
+                path = entries[error['index']][0]
+                failed_paths.add(path)
+                logging.error(f"Error writing {collection_name} entry for {path}: {error.get('errmsg')}")
+            written += len(entries) - len(write_errors)
+    return written
+
+async def index_file(file_path: Path) -> bool:
     """Index a single file"""
     try:
-        if not file_path.exists() or file_path.is_dir():
-            return None
-        
-        # Extract content
-        content, thumbnail = extract_document_content(file_path)
-        
-        if not content:  # Skip files we can't parse
-            return None
-        
-        relative_path = str(file_path.relative_to(DOCUMENT_ROOT))
-        file_stats = file_path.stat()
-        
-        doc_file = DocumentFile(
-            name=file_path.name,
-            path=str(file_path),
-            relative_path=relative_path,
-            file_type=file_path.suffix.lower(),
-            size=file_stats.st_size,
-            content=content,
-            thumbnail=thumbnail
-        )
-        
-        # Store in database
-        doc_dict = doc_file.dict()
-        doc_dict['created_at'] = doc_dict['created_at'].isoformat()
-        doc_dict['updated_at'] = doc_dict['updated_at'].isoformat()
-        doc_dict['indexed_at'] = doc_dict['indexed_at'].isoformat()
-        
-        await db.documents.replace_one(
-            {"path": str(file_path)}, 
-            doc_dict, 
-            upsert=True
-        )
+        existing = await db.documents.find_one({"path": str(file_path)}, INDEX_STATE_PROJECTION)
+        operations = await build_index_operations(file_path, existing)
+        if not operations:
+            return False
         
+        await write_index_operations({name: [(str(file_path), op)] for name, op in operations.items()})
         logging.info(f"Indexed file: {file_path}")
-        return doc_file
+        return True
         
     except Exception as e:
         logging.error(f"Error indexing file {file_path}: {e}")
-        return None
+        return False
+
+async def remove_file_from_index(path: str):
+    """Remove a file, or every file below a folder, from the index"""
+    # A folder moved out of the root only produces a single folder event
+    removed = {"$or": [{"path": path}, {"path": {"$regex": "^" + re.escape(path + os.sep)}}]}
+    await db.documents.delete_many(removed)
+    await db.document_contents.delete_many(removed)
+
+async def safe_build_index_operations(file_path: Path, existing: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Build index operations, logging instead of raising on failure"""
+    try:
+        return await build_index_operations(file_path, existing)
+    except Exception as e:
+        logging.error(f"Error indexing file {file_path}: {e}")
+        return {}
+
+def list_document_files(root: Path) -> List[Path]:
+    """List all supported document files below root"""
+    return [
+        file_path for file_path in root.rglob("*")
+        if file_path.is_file() and file_path.suffix.lower() in SUPPORTED_EXTENSIONS
+    ]
 
 async def scan_directory():
     """Scan the document directory and index all files"""
@@ -219,41 +450,205 @@ async def scan_directory():
         logging.warning(f"Document root {DOCUMENT_ROOT} does not exist")
         return
     
-    supported_extensions = {'.pdf', '.docx', '.doc', '.xlsx', '.xls', '.txt', '.rtf'}
+    # Pre-load stored state so unchanged files are skipped without a query each.
+    # Loaded before listing so files the watcher indexes meanwhile aren't pruned.
+    existing_docs = {}
+    async for doc in db.documents.find({}, INDEX_STATE_PROJECTION):
+        existing_docs[doc['path']] = doc
+    
+    file_paths = await asyncio.to_thread(list_document_files, DOCUMENT_ROOT)
     
-    for file_path in DOCUMENT_ROOT.rglob("*"):
-        if file_path.is_file() and file_path.suffix.lower() in supported_extensions:
-            await index_file(file_path)
+    # Drop files deleted while the watcher wasn't running
+    stale_paths = list(set(existing_docs) - {str(file_path) for file_path in file_paths})
+    for start in range(0, len(stale_paths), BULK_WRITE_SIZE):
+        stale = {"path": {"$in": stale_paths[start:start + BULK_WRITE_SIZE]}}
+        await db.documents.delete_many(stale)
+        await db.document_contents.delete_many(stale)
+    if stale_paths:
+        logging.info(f"Removed {len(stale_paths)} missing files from index")
+    
+    pending = {"document_contents": [], "documents": []}
+    written = 0
+    
+    # Index in bounded batches so parsing fans out across the process pool
+    for start in range(0, len(file_paths), SCAN_BATCH_SIZE):
+        batch = file_paths[start:start + SCAN_BATCH_SIZE]
+        batch_operations = await asyncio.gather(*[
+            safe_build_index_operations(file_path, existing_docs.get(str(file_path)))
+            for file_path in batch
+        ])
+        for file_path, operations in zip(batch, batch_operations):
+            for collection_name, operation in operations.items():
+                pending[collection_name].append((str(file_path), operation))
+        
+        if len(pending["documents"]) >= BULK_WRITE_SIZE:
+            written += await write_index_operations(pending)
+    
+    written += await write_index_operations(pending)
     
     global last_scan_time
     last_scan_time = datetime.now(timezone.utc)
-    logging.info("Directory scan completed")
+    logging.info(f"Directory scan completed ({written} index writes)")
 
-def build_file_tree(path: Path) -> FileTreeNode:
-    """Build file tree structure"""
-    node = FileTreeNode(
+def build_file_tree(path: Path, max_depth: Optional[int] = None) -> FileTreeNode:
+    """Build file tree structure, optionally stopping max_depth levels below path"""
+    root = FileTreeNode(
         name=path.name,
         path=str(path),
         type='folder' if path.is_dir() else 'file',
         children=[]
     )
     
-    if path.is_dir():
+    # Walk iteratively; DirEntry caches file type from the directory read
+    stack = [(root, 0)] if root.type == 'folder' else []
+    while stack:
+        node, depth = stack.pop()
+        if max_depth is not None and depth >= max_depth:
+            continue
         try:
-            for child in sorted(path.iterdir()):
-                if child.is_dir() or child.suffix.lower() in {'.pdf', '.docx', '.doc', '.xlsx', '.xls', '.txt', '.rtf'}:
-                    node.children.append(build_file_tree(child))
-        except PermissionError:
-            pass
+            with os.scandir(node.path) as entries:
+                entries = sorted(entries, key=lambda entry: entry.name)
+        except OSError:
+            # Unreadable, or removed between listing its parent and now
+            continue
+        
+        for entry in entries:
+            is_dir = entry.is_dir(follow_symlinks=False)
+            if not is_dir and os.path.splitext(entry.name)[1].lower() not in SUPPORTED_EXTENSIONS:
+                continue
+            
+            child = FileTreeNode(
+                name=entry.name,
+                path=entry.path,
+                type='folder' if is_dir else 'file',
+                children=[]
+            )
+            node.children.append(child)
+            if is_dir:
+                stack.append((child, depth + 1))
     
-    return node
+    return root
+
+async def ensure_indexes():
+    """Create database indexes used by search and document lookups"""
+    try:
+        await db.document_contents.create_index(
+            [("content", "text"), ("name", "text")],
+            weights={"name": 10, "content": 1},
+            default_language="none"
+        )
+        await db.document_contents.create_index("path", unique=True)
+        await db.document_contents.create_index("phraselist")
+        await db.documents.create_index("id", unique=True)
+        await db.documents.create_index("path", unique=True)
+        await db.documents.create_index("relative_path")
+    except Exception as e:
+        logging.error(f"Error creating database indexes: {e}")
+
+def invalidate_file_tree_cache():
+    """Drop the cached /file-tree response"""
+    global file_tree_cache, file_tree_generation
+    file_tree_cache = None
+    file_tree_generation += 1
+
+# File system monitoring
+class DocumentEventHandler(FileSystemEventHandler):
+    """Forward file system events to the indexing queue"""
+    
+    def __init__(self, loop: asyncio.AbstractEventLoop, queue: asyncio.Queue):
+        super().__init__()
+        self.loop = loop
+        self.queue = queue
+    
+    def on_any_event(self, event):
+        # Only structural changes affect the tree; opens, closes and content
+        # modifications (including the indexer's own reads) do not
+        if event.event_type not in (EVENT_TYPE_CREATED, EVENT_TYPE_DELETED, EVENT_TYPE_MOVED):
+            return
+        paths = [event.src_path, getattr(event, 'dest_path', '')]
+        if event.is_directory or any(Path(p).suffix.lower() in SUPPORTED_EXTENSIONS for p in paths if p):
+            self.loop.call_soon_threadsafe(invalidate_file_tree_cache)
+    
+    def _enqueue(self, path: str, is_directory: bool = False):
+        if is_directory or Path(path).suffix.lower() in SUPPORTED_EXTENSIONS:
+            self.loop.call_soon_threadsafe(schedule_file_event, self.queue, path)
+    
+    def on_created(self, event):
+        if not event.is_directory:
+            self._enqueue(event.src_path)
+    
+    def on_modified(self, event):
+        if not event.is_directory:
+            self._enqueue(event.src_path)
+    
+    def on_deleted(self, event):
+        self._enqueue(event.src_path, event.is_directory)
+    
+    def on_moved(self, event):
+        self._enqueue(event.src_path, event.is_directory)
+        self._enqueue(event.dest_path, event.is_directory)
+
+def schedule_file_event(queue: asyncio.Queue, path: str):
+    """Queue a path once no further events have arrived for FILE_EVENT_DEBOUNCE"""
+    # Editors save through several writes/renames; only the final state is indexed
+    handle = pending_file_events.pop(path, None)
+    if handle is not None:
+        handle.cancel()
+    
+    def release():
+        pending_file_events.pop(path, None)
+        queue.put_nowait(path)
+    
+    pending_file_events[path] = asyncio.get_running_loop().call_later(FILE_EVENT_DEBOUNCE, release)
+
+async def process_file_events():
+    """Index or remove files reported by the file system observer"""
+    while True:
+        path = await index_queue.get()
+        try:
+            file_path = Path(path)
+            if file_path.is_dir():
+                for child_path in await asyncio.to_thread(list_document_files, file_path):
+                    await index_file(child_path)
+            elif file_path.exists():
+                await index_file(file_path)
+            else:
+                await remove_file_from_index(path)
+                logging.info(f"Removed file from index: {path}")
+        except Exception as e:
+            logging.error(f"Error processing file event for {path}: {e}")
+        finally:
+            index_queue.task_done()
+
+def start_file_observer() -> bool:
+    """Start watching the document root for changes, returning whether it worked"""
+    global file_observer, index_queue, file_event_task
+    
+    if not DOCUMENT_ROOT.exists():
+        logging.warning(f"Document root {DOCUMENT_ROOT} does not exist, file monitoring disabled")
+        return False
+    
+    index_queue = asyncio.Queue()
+    handler = DocumentEventHandler(asyncio.get_running_loop(), index_queue)
+    observer = Observer()
+    try:
+        # Recursive inotify watches are added here and can hit the system limit
+        observer.schedule(handler, str(DOCUMENT_ROOT), recursive=True)
+        observer.start()
+    except OSError as e:
+        logging.error(f"Could not watch {DOCUMENT_ROOT}, file monitoring disabled: {e}")
+        return False
+    
+    file_observer = observer
+    file_event_task = asyncio.create_task(process_file_events())
+    logging.info(f"Watching {DOCUMENT_ROOT} for changes")
+    return True
 
-# Background task for periodic scanning
 async def periodic_scan():
-    """Periodic scanning task"""
+    """Periodic scanning task, used when file monitoring is unavailable"""
     while True:
         try:
-            await asyncio.sleep(300)  # 5 minutes
+            await asyncio.sleep(PERIODIC_SCAN_INTERVAL)
             await scan_directory()
         except Exception as e:
             logging.error(f"Error in periodic scan: {e}")
@@ -270,13 +665,37 @@ async def manual_scan(background_tasks: BackgroundTasks):
     return {"message": "Scan initiated"}
 
 @api_router.get("/file-tree")
-async def get_file_tree():
-    """Get file tree structure"""
+async def get_file_tree(path: Optional[str] = None, depth: Optional[int] = None):
+    """Get file tree structure, optionally only a subtree and/or a limited depth"""
+    global file_tree_cache
+    
     if not DOCUMENT_ROOT.exists():
         return {"error": "Document root not found"}
     
-    tree = build_file_tree(DOCUMENT_ROOT)
-    return tree
+    # Partial trees are cheap to build and are not cached
+    if path is not None or depth is not None:
+        tree_root = DOCUMENT_ROOT / (path or "")
+        if not tree_root.resolve().is_relative_to(DOCUMENT_ROOT.resolve()) or not tree_root.is_dir():
+            raise HTTPException(status_code=404, detail="Folder not found")
+        if depth is not None and depth < 0:
+            raise HTTPException(status_code=400, detail="depth must not be negative")
+        return await asyncio.to_thread(build_file_tree, tree_root, depth)
+    
+    # Without a running observer nothing would invalidate a cached tree
+    if file_observer is None or not file_observer.is_alive():
+        tree = await asyncio.to_thread(build_file_tree, DOCUMENT_ROOT)
+        return Response(content=tree.model_dump_json().encode(), media_type="application/json")
+    
+    async with file_tree_lock:
+        tree_json = file_tree_cache
+        if tree_json is None:
+            generation = file_tree_generation
+            tree = await asyncio.to_thread(build_file_tree, DOCUMENT_ROOT)
+            tree_json = tree.model_dump_json().encode()
+            if generation == file_tree_generation:
+                file_tree_cache = tree_json
+    
+    return Response(content=tree_json, media_type="application/json")
 
 @api_router.post("/search")
 async def search_documents(request: SearchRequest):
@@ -285,8 +704,79 @@ async def search_documents(request: SearchRequest):
         if not request.query.strip():
             return {"results": [], "total": 0}
         
-        # MongoDB text search
-        pipeline = [
+        # Snippets are cut inside the pipeline so full document content
+        # never leaves the database
+        result_stages = [
+            {"$limit": request.limit},
+            {
+                "$addFields": {
+                    # Case-insensitive regex rather than $toLower, which only
+                    # handles ASCII; idx is a code point offset, -1 if absent
+                    "snippet_pos": {
+                        "$let": {
+                            "vars": {"found": {"$regexFind": {"input": "$content", "regex": re.escape(request.query), "options": "i"}}},
+                            "in": {"$ifNull": ["$$found.idx", -1]}
+                        }
+                    },
+                    "content_length": {"$strLenCP": "$content"}
+                }
+            },
+            {
+                "$addFields": {
+                    "snippet": {
+                        "$cond": [
+                            {"$gte": ["$snippet_pos", 0]},
+                            {
+                                "$let": {
+                                    "vars": {"start": {"$max": [0, {"$subtract": ["$snippet_pos", 50]}]}},
+                                    "in": {
+                                        "$substrCP": [
+                                            "$content",
+                                            "$$start",
+                                            {"$subtract": [{"$add": ["$snippet_pos", len(request.query) + 100]}, "$$start"]}
+                                        ]
+                                    }
+                                }
+                            },
+                            {"$substrCP": ["$content", 0, 150]}
+                        ]
+                    }
+                }
+            },
+            {"$project": {"content": 0}},
+            {
+                "$lookup": {
+                    "from": "documents",
+                    "localField": "path",
+                    "foreignField": "path",
+                    "as": "document"
+                }
+            },
+            {"$unwind": "$document"},
+            # Shape results as {document, relevance_score, snippet} dicts so
+            # they can be returned as-is
+            {
+                "$project": {
+                    "_id": 0,
+                    "document": 1,
+                    "relevance_score": 1,
+                    "snippet": {
+                        "$switch": {
+                            "branches": [
+                                {"case": {"$gte": ["$snippet_pos", 0]}, "then": {"$concat": ["...", "$snippet", "..."]}},
+                                {"case": {"$gt": ["$content_length", 150]}, "then": {"$concat": ["$snippet", "..."]}}
+                            ],
+                            "default": "$snippet"
+                        }
+                    }
+                }
+            },
+            {"$unset": "document._id"}
+        ]
+        
+        # MongoDB text search always runs, so documents matching the words
+        # outside their indexed phrases, and $text operators, are kept
+        text_pipeline = [
             {
                 "$match": {
                     "$text": {"$search": request.query}
@@ -299,45 +789,28 @@ async def search_documents(request: SearchRequest):
             },
             {
                 "$sort": {"relevance_score": {"$meta": "textScore"}}
-            },
-            {"$limit": request.limit}
+            }
         ]
+        searches = [db.document_contents.aggregate(text_pipeline + result_stages).to_list(length=None)]
         
-        # Create text index if it doesn't exist
-        try:
-            await db.documents.create_index([("content", "text"), ("name", "text")])
-        except Exception as e:
-            logging.info(f"Text index already exists or error creating: {e}")
+        # Short multi-word queries also match precomputed phrases, scored by
+        # the number of query phrases a document contains
+        if uses_phrase_search(request.query):
+            query_phrases = build_phraselist(request.query)
+            phrase_pipeline = [
+                {"$match": {"phraselist": {"$in": query_phrases}}},
+                {
+                    "$addFields": {
+                        "relevance_score": {"$size": {"$setIntersection": ["$phraselist", query_phrases]}}
+                    }
+                },
+                {"$project": {"phraselist": 0}},
+                {"$sort": {"relevance_score": -1}}
+            ]
+            searches.append(db.document_contents.aggregate(phrase_pipeline + result_stages).to_list(length=None))
         
-        results = []
-        async for doc in db.documents.aggregate(pipeline):
-            # Generate snippet
-            content = doc.get('content', '')
-            query_lower = request.query.lower()
-            
-            # Find best snippet
-            snippet_start = content.lower().find(query_lower)
-            if snippet_start != -1:
-                start = max(0, snippet_start - 50)
-                end = min(len(content), snippet_start + len(request.query) + 100)
-                snippet = "..." + content[start:end] + "..."
-            else:
-                snippet = content[:150] + "..." if len(content) > 150 else content
-            
-            # Parse datetime strings back to datetime objects
-            if isinstance(doc.get('created_at'), str):
-                doc['created_at'] = datetime.fromisoformat(doc['created_at'])
-            if isinstance(doc.get('updated_at'), str):
-                doc['updated_at'] = datetime.fromisoformat(doc['updated_at'])
-            if isinstance(doc.get('indexed_at'), str):
-                doc['indexed_at'] = datetime.fromisoformat(doc['indexed_at'])
-            
-            search_result = SearchResult(
-                document=DocumentFile(**doc),
-                relevance_score=doc.get('relevance_score', 0),
-                snippet=snippet
-            )
-            results.append(search_result)
+        text_results, *phrase_results = await asyncio.gather(*searches)
+        results = merge_search_results(text_results, phrase_results[0] if phrase_results else [], request.limit)
         
         return {"results": results, "total": len(results), "query": request.query}
         
@@ -346,37 +819,49 @@ async def search_documents(request: SearchRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 @api_router.get("/documents/{doc_id}")
-async def get_document(doc_id: str):
-    """Get a specific document"""
+async def get_document(doc_id: str, preview: bool = False):
+    """Get a specific document, or just a short text preview of its content"""
     doc = await db.documents.find_one({"id": doc_id})
     if not doc:
         raise HTTPException(status_code=404, detail="Document not found")
     
-    # Parse datetime strings
-    if isinstance(doc.get('created_at'), str):
-        doc['created_at'] = datetime.fromisoformat(doc['created_at'])
-    if isinstance(doc.get('updated_at'), str):
-        doc['updated_at'] = datetime.fromisoformat(doc['updated_at'])
-    if isinstance(doc.get('indexed_at'), str):
-        doc['indexed_at'] = datetime.fromisoformat(doc['indexed_at'])
+    if preview:
+        # Only the first PREVIEW_LENGTH characters leave the database
+        content_projection = {"_id": 0, "content": {"$substrCP": ["$content", 0, PREVIEW_LENGTH]}}
+    else:
+        content_projection = {"_id": 0, "content": 1}
+    content_doc = await db.document_contents.find_one({"path": doc['path']}, content_projection)
+    doc['content'] = content_doc.get('content') if content_doc else None
     
     return DocumentFile(**doc)
 
 @api_router.get("/documents/{doc_id}/download")
-async def download_document(doc_id: str):
+async def download_document(doc_id: str, request: Request):
     """Download a specific document"""
     doc = await db.documents.find_one({"id": doc_id})
     if not doc:
         raise HTTPException(status_code=404, detail="Document not found")
     
     file_path = Path(doc['path'])
-    if not file_path.exists():
+    try:
+        file_stats = await asyncio.to_thread(file_path.stat)
+    except FileNotFoundError:
         raise HTTPException(status_code=404, detail="File not found on disk")
     
+    # The stored content hash is only trusted while the file is unchanged on disk
+    headers = {}
+    etag = download_etag(doc, file_stats)
+    if etag:
+        # A 304 must repeat the caching headers the 200 would have sent
+        headers = {"ETag": etag, "Cache-Control": "private, max-age=3600"}
+        if etag_matches(request.headers.get("if-none-match", ""), etag):
+            return Response(status_code=304, headers=headers)
+    
     return FileResponse(
         path=str(file_path),
         filename=doc['name'],
-        media_type='application/octet-stream'
+        media_type='application/octet-stream',
+        headers=headers
     )
 
 @api_router.get("/documents/path/{path:path}")
@@ -386,13 +871,8 @@ async def get_document_by_path(path: str):
     if not doc:
         raise HTTPException(status_code=404, detail="Document not found")
     
-    # Parse datetime strings
-    if isinstance(doc.get('created_at'), str):
-        doc['created_at'] = datetime.fromisoformat(doc['created_at'])
-    if isinstance(doc.get('updated_at'), str):
-        doc['updated_at'] = datetime.fromisoformat(doc['updated_at'])
-    if isinstance(doc.get('indexed_at'), str):
-        doc['indexed_at'] = datetime.fromisoformat(doc['indexed_at'])
+    content_doc = await db.document_contents.find_one({"path": doc['path']}, {"_id": 0, "content": 1})
+    doc['content'] = content_doc.get('content') if content_doc else None
     
     return DocumentFile(**doc)
 
@@ -427,12 +907,27 @@ logger = logging.getLogger(__name__)
 @app.on_event("startup")
 async def startup_event():
     """Initialize the application"""
+    global parse_executor, initial_scan_task, periodic_scan_task
+    parse_executor = ProcessPoolExecutor(max_workers=os.cpu_count())
+    await ensure_indexes()
     # Create initial index
-    asyncio.create_task(scan_directory())
-    # Start periodic scanning
-    asyncio.create_task(periodic_scan())
+    initial_scan_task = asyncio.create_task(scan_directory())
+    # Pick up subsequent changes incrementally, or rescan periodically if the
+    # root can't be watched
+    if not start_file_observer():
+        periodic_scan_task = asyncio.create_task(periodic_scan())
     logging.info("Document indexer started")
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    if file_observer is not None:
+        file_observer.stop()
+        file_observer.join()
+    for task in (file_event_task, initial_scan_task, periodic_scan_task):
+        if task is not None:
+            task.cancel()
+    for handle in pending_file_events.values():
+        handle.cancel()
+    if parse_executor is not None:
+        parse_executor.shutdown(cancel_futures=True)
     client.close()
\ No newline at end of file
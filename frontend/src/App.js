@@ -268,6 +268,16 @@ function App() {
     }
   };
 
+  const loadDocumentById = async (id) => {
+    try {
+      const response = await axios.get(`${API}/documents/${id}`);
+      return response.data;
+    } catch (error) {
+      console.error('Error loading document:', error);
+      return null;
+    }
+  };
+
   const handleSearch = async (e) => {
     e.preventDefault();
     if (!searchQuery.trim()) {
@@ -318,8 +328,9 @@ function App() {
     }
     setExpandedPaths(newExpandedPaths);
 
-    // Show document preview in main area
-    setPreviewDocument(result.document);
+    // Show document preview in main area (search results carry no content)
+    const document = await loadDocumentById(result.document.id);
+    setPreviewDocument(document || result.document);
   };
 
   const handleDownload = (document) => {
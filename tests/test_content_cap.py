@@ -0,0 +1,52 @@
+import os
+import sys
+from pathlib import Path
+
+os.environ.setdefault('MONGO_URL', 'mongodb://localhost:27017')
+os.environ.setdefault('DB_NAME', 'test_database')
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'backend'))
+
+import server  # noqa: E402
+from server import cap_content, collect_until_cap  # noqa: E402
+
+
+def test_cap_content_keeps_content_under_the_cap(monkeypatch):
+    monkeypatch.setattr(server, 'MAX_INDEXED_CONTENT_BYTES', 10)
+    assert cap_content("abc") == ("abc", False)
+
+
+def test_cap_content_keeps_content_exactly_at_the_cap(monkeypatch):
+    monkeypatch.setattr(server, 'MAX_INDEXED_CONTENT_BYTES', 4)
+    assert cap_content("żż") == ("żż", False)
+
+
+def test_cap_content_truncates_and_flags(monkeypatch):
+    monkeypatch.setattr(server, 'MAX_INDEXED_CONTENT_BYTES', 5)
+    assert cap_content("abcdefgh") == ("abcde", True)
+
+
+def test_cap_content_drops_a_character_split_by_the_cap(monkeypatch):
+    # "ż" is two bytes in UTF-8, so a 5-byte cap lands inside the third one
+    monkeypatch.setattr(server, 'MAX_INDEXED_CONTENT_BYTES', 5)
+    content, truncated = cap_content("żżżż")
+    assert content == "żż"
+    assert truncated
+    assert len(content.encode('utf-8')) <= 5
+
+
+def test_collect_until_cap_stops_consuming_after_the_cap(monkeypatch):
+    monkeypatch.setattr(server, 'MAX_INDEXED_CONTENT_BYTES', 5)
+    consumed = []
+
+    def pieces():
+        for piece in ["abc", "def", "ghi"]:
+            consumed.append(piece)
+            yield piece
+
+    assert collect_until_cap(pieces()) == ["abc", "def"]
+    assert consumed == ["abc", "def"]
+
+
+def test_collect_until_cap_keeps_everything_under_the_cap(monkeypatch):
+    monkeypatch.setattr(server, 'MAX_INDEXED_CONTENT_BYTES', 100)
+    assert collect_until_cap(["abc", "def"]) == ["abc", "def"]
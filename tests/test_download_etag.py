@@ -0,0 +1,67 @@
+import os
+import sys
+from pathlib import Path
+
+os.environ.setdefault('MONGO_URL', 'mongodb://localhost:27017')
+os.environ.setdefault('DB_NAME', 'test_database')
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'backend'))
+
+from server import download_etag, etag_matches  # noqa: E402
+
+
+def indexed(file_path, **overrides):
+    file_stats = file_path.stat()
+    doc = {"content_hash": "abc123", "mtime_ns": file_stats.st_mtime_ns, "size": file_stats.st_size}
+    doc.update(overrides)
+    return doc, file_stats
+
+
+def test_download_etag_quotes_the_content_hash(tmp_path):
+    file_path = tmp_path / "a.txt"
+    file_path.write_text("hello")
+    assert download_etag(*indexed(file_path)) == '"abc123"'
+
+
+def test_download_etag_is_dropped_when_mtime_differs(tmp_path):
+    file_path = tmp_path / "a.txt"
+    file_path.write_text("hello")
+    doc, file_stats = indexed(file_path)
+    doc["mtime_ns"] -= 1
+    assert download_etag(doc, file_stats) is None
+
+
+def test_download_etag_is_dropped_when_size_differs(tmp_path):
+    file_path = tmp_path / "a.txt"
+    file_path.write_text("hello")
+    doc, file_stats = indexed(file_path, size=1)
+    assert download_etag(doc, file_stats) is None
+
+
+def test_download_etag_needs_a_content_hash(tmp_path):
+    file_path = tmp_path / "a.txt"
+    file_path.write_text("hello")
+    doc, file_stats = indexed(file_path)
+    del doc["content_hash"]
+    assert download_etag(doc, file_stats) is None
+
+
+def test_etag_matches_exact_tag():
+    assert etag_matches('"abc123"', '"abc123"')
+    assert not etag_matches('"other"', '"abc123"')
+
+
+def test_etag_matches_weak_tag():
+    assert etag_matches('W/"abc123"', '"abc123"')
+
+
+def test_etag_matches_any_tag_in_a_list():
+    assert etag_matches('"one", W/"abc123" ,"two"', '"abc123"')
+    assert not etag_matches('"one", "two"', '"abc123"')
+
+
+def test_etag_matches_wildcard():
+    assert etag_matches('*', '"abc123"')
+
+
+def test_etag_matches_missing_header():
+    assert not etag_matches('', '"abc123"')
@@ -0,0 +1,69 @@
+import os
+import sys
+from pathlib import Path
+
+os.environ.setdefault('MONGO_URL', 'mongodb://localhost:27017')
+os.environ.setdefault('DB_NAME', 'test_database')
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'backend'))
+
+from server import SUPPORTED_EXTENSIONS, build_file_tree  # noqa: E402
+
+
+def recursive_tree(path, max_depth=None):
+    """The recursive walk build_file_tree replaced, with the same depth limit"""
+    children = []
+    if path.is_dir() and (max_depth is None or max_depth > 0):
+        for child in sorted(path.iterdir()):
+            if child.is_dir() or child.suffix.lower() in SUPPORTED_EXTENSIONS:
+                children.append(recursive_tree(child, None if max_depth is None else max_depth - 1))
+    return (path.name, str(path), 'folder' if path.is_dir() else 'file', children)
+
+
+def as_tuples(node):
+    return (node.name, node.path, node.type, [as_tuples(child) for child in node.children])
+
+
+def make_tree(root):
+    for relative_path in [
+        "a.pdf",
+        "B.DOCX",
+        "notes.txt",
+        "skip.png",
+        "empty",
+        "docs/report.xlsx",
+        "docs/image.jpg",
+        "docs/old/legacy.doc",
+        "docs/old/deeper/last.rtf",
+        "zeta/data.xls",
+    ]:
+        path = root / relative_path
+        if relative_path == "empty":
+            path.mkdir()
+            continue
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text("x")
+
+
+def test_build_file_tree_matches_recursive_walk(tmp_path):
+    make_tree(tmp_path)
+    assert as_tuples(build_file_tree(tmp_path)) == recursive_tree(tmp_path)
+
+
+def test_build_file_tree_matches_recursive_walk_at_each_depth(tmp_path):
+    make_tree(tmp_path)
+    for max_depth in range(5):
+        assert as_tuples(build_file_tree(tmp_path, max_depth=max_depth)) == recursive_tree(tmp_path, max_depth)
+
+
+def test_build_file_tree_depth_limit_leaves_folders_unexpanded(tmp_path):
+    make_tree(tmp_path)
+    tree = build_file_tree(tmp_path, max_depth=1)
+    docs = next(child for child in tree.children if child.name == "docs")
+    assert docs.type == 'folder'
+    assert docs.children == []
+
+
+def test_build_file_tree_of_a_file(tmp_path):
+    file_path = tmp_path / "a.pdf"
+    file_path.write_text("x")
+    assert as_tuples(build_file_tree(file_path)) == ("a.pdf", str(file_path), 'file', [])
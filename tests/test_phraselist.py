@@ -0,0 +1,68 @@
+import os
+import sys
+from pathlib import Path
+
+os.environ.setdefault('MONGO_URL', 'mongodb://localhost:27017')
+os.environ.setdefault('DB_NAME', 'test_database')
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'backend'))
+
+import server  # noqa: E402
+from server import build_phraselist, merge_search_results, tokenize, uses_phrase_search  # noqa: E402
+
+
+def result(path, score):
+    return {"document": {"path": path}, "relevance_score": score, "snippet": ""}
+
+
+def test_tokenize_lowercases_and_drops_punctuation():
+    assert tokenize("Ala, ma KOTA!") == ["ala", "ma", "kota"]
+
+
+def test_tokenize_keeps_unicode_words():
+    assert tokenize("Łódź ŻUK zażółć") == ["łódź", "żuk", "zażółć"]
+
+
+def test_build_phraselist_collects_two_to_six_word_phrases_in_order():
+    assert build_phraselist("a b c") == ["a b", "a b c", "b c"]
+
+
+def test_build_phraselist_ignores_single_words():
+    assert build_phraselist("") == []
+    assert build_phraselist("word") == []
+
+
+def test_build_phraselist_caps_phrase_length():
+    phrases = build_phraselist("one two three four five six seven")
+    assert "one two three four five six" in phrases
+    assert "one two three four five six seven" not in phrases
+
+
+def test_build_phraselist_deduplicates():
+    assert build_phraselist("a b a b") == ["a b", "a b a", "a b a b", "b a", "b a b"]
+
+
+def test_build_phraselist_caps_phrase_count(monkeypatch):
+    monkeypatch.setattr(server, 'MAX_PHRASES_PER_DOCUMENT', 3)
+    assert build_phraselist("a b c d e f g h") == ["a b", "a b c", "a b c d"]
+
+
+def test_uses_phrase_search():
+    assert uses_phrase_search("umowa najmu")
+    assert not uses_phrase_search("umowa")
+    assert not uses_phrase_search("one two three four five six seven")
+    assert not uses_phrase_search("umowa -najmu")
+    assert not uses_phrase_search('"umowa najmu"')
+
+
+def test_merge_search_results_boosts_and_unions_hits():
+    text_results = [result("/a", 2.0), result("/b", 1.5)]
+    phrase_results = [result("/b", 3), result("/c", 1)]
+    merged = merge_search_results(text_results, phrase_results, limit=10)
+    assert [(r["document"]["path"], r["relevance_score"]) for r in merged] == [
+        ("/b", 4.5), ("/a", 2.0), ("/c", 1.0)
+    ]
+
+
+def test_merge_search_results_respects_limit():
+    merged = merge_search_results([result("/a", 1.0), result("/b", 2.0)], [], limit=1)
+    assert [r["document"]["path"] for r in merged] == ["/b"]